@@ -0,0 +1,627 @@
+#!/usr/bin/env python3
+"""
+Compile-time profiler for the engine build
+
+Runs (or reads the results of) a Ninja build and attributes compile time to
+translation units, headers and template instantiations.
+
+Sources of data:
+  .ninja_log            wall time of every build edge (always available)
+  clang -ftime-trace    <object>.json next to every object file
+  gcc -ftime-report     per-phase timings, read from a captured build log
+
+Usage:
+  buildprofile.py run [--build-dir build-profile] [--clang-trace | --gcc-report]
+  buildprofile.py report [--build-dir build-profile] [--top 30] [--save out.json] [--folded out.folded]
+  buildprofile.py compare old.json new.json [--threshold 10] [--min-ms 250]
+
+'run' configures the tree with the Ninja generator and the requested timing
+flags, builds it and then prints the report for exactly that build. 'report'
+on its own has to guess where the last build starts in .ninja_log, which is
+best effort. The folded output can be fed to flamegraph.pl or speedscope.
+
+The default build dir is build-profile/, not build/: the setup scripts
+configure build/ with other generators and 'run' changes the compile flags.
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.normpath(os.path.join(SCRIPT_PATH, os.pardir, os.pardir))
+
+OBJECT_EXTENSIONS = ('.o', '.obj')
+GCC_LOG_NAME = 'buildprofile_gcc.log'
+BUILD_DIR = os.path.join(ROOT_DIR, 'build-profile')
+# Traces are written after the object file; allow for coarse file timestamps.
+TRACE_MTIME_SLACK = 2.0
+
+# Ninja prints this before the output of every edge when not running verbose.
+NINJA_STATUS_RE = re.compile(r'^\[\d+/\d+\] Building (?:C|CXX) object (\S+)')
+# ' phase parsing   :   1.23 ( 45%)   0.20 ( 40%)   1.45 ( 44%)   ...'
+GCC_PHASE_RE = re.compile(r'^\s*(phase [^:]+?|TOTAL)\s*:(.*)$')
+GCC_TIME_RE = re.compile(r'([\d.]+)\s*\(\s*\d+%\)')
+
+# clang -ftime-trace event names we care about
+CLANG_HEADER_EVENT = 'Source'
+CLANG_TEMPLATE_EVENTS = ('InstantiateClass', 'InstantiateFunction')
+CLANG_PHASE_EVENTS = ('Frontend', 'Backend', 'Optimizer', 'CodeGenPasses')
+
+TIMING_FLAGS = ('-ftime-trace', '-ftime-report')
+CACHE_FLAGS_RE = re.compile(r'^(CMAKE_(?:C|CXX)_FLAGS|CMAKE_GENERATOR):[A-Z]+=(.*)$')
+
+
+def read_cached_flags(build_dir):
+    """Return CMAKE_C_FLAGS, CMAKE_CXX_FLAGS and CMAKE_GENERATOR from an existing CMakeCache.txt"""
+    cache_path = os.path.join(build_dir, 'CMakeCache.txt')
+    flags = {}
+    if not os.path.exists(cache_path):
+        return flags
+    with open(cache_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            match = CACHE_FLAGS_RE.match(line.rstrip('\n'))
+            if match:
+                flags[match.group(1)] = match.group(2)
+    return flags
+
+
+def timing_flag_args(build_dir, flag):
+    """CMake -D arguments that add `flag` to the compile flags, or take the timing flags out again
+
+    The user's own flags are kept. A fresh build dir gets the flag through
+    CMAKE_<LANG>_FLAGS_INIT so that CFLAGS/CXXFLAGS from the environment still
+    apply; an existing cache has its value extended instead.
+    """
+    cached = read_cached_flags(build_dir)
+    args = []
+    for variable in ('CMAKE_C_FLAGS', 'CMAKE_CXX_FLAGS'):
+        if variable not in cached:
+            if flag:
+                args.append('-D%s_INIT=%s' % (variable, flag))
+            continue
+        current = [f for f in cached[variable].split() if f not in TIMING_FLAGS]
+        if flag:
+            current.append(flag)
+        value = ' '.join(current)
+        if value != cached[variable]:
+            args.append('-D%s=%s' % (variable, value))
+    return args
+
+
+def run_build(build_dir, source_dir, clang_trace, gcc_report, jobs, extra_cmake):
+    """Configure with Ninja and build, capturing timing output
+
+    Returns the gcc log (or None) and the size .ninja_log had before the build,
+    so that only the entries this build appended get reported.
+    """
+
+    build_dir = os.path.abspath(build_dir)
+    generator = read_cached_flags(build_dir).get('CMAKE_GENERATOR')
+    if generator and generator != 'Ninja':
+        raise ValueError("%s is configured for '%s', not Ninja - pass a different --build-dir"
+                         % (build_dir, generator))
+    os.makedirs(build_dir, exist_ok=True)
+
+    flags = ''
+    if clang_trace:
+        flags = '-ftime-trace'
+    elif gcc_report:
+        flags = '-ftime-report'
+
+    configure = ['cmake', '-G', 'Ninja', '-S', source_dir, '-B', build_dir]
+    configure.extend(timing_flag_args(build_dir, flags))
+    configure.extend(extra_cmake)
+
+    print("🔧 Configuring: " + ' '.join(configure))
+    subprocess.check_call(configure)
+
+    build = ['cmake', '--build', build_dir]
+    if jobs:
+        build.extend(['--parallel', str(jobs)])
+
+    ninja_log = os.path.join(build_dir, '.ninja_log')
+    log_offset = os.path.getsize(ninja_log) if os.path.exists(ninja_log) else 0
+
+    print("🔨 Building: " + ' '.join(build))
+    if not gcc_report:
+        subprocess.check_call(build)
+        return None, log_offset
+
+    # -ftime-report goes to stderr; ninja forwards it together with the edge
+    # description, which is how the timings get matched up with the TU later.
+    # Everything is echoed as well, so errors show up as in a normal build.
+    log_path = os.path.join(build_dir, GCC_LOG_NAME)
+    with open(log_path, 'w', encoding='utf-8') as log:
+        proc = subprocess.Popen(build, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True, errors='replace')
+        for line in proc.stdout:
+            log.write(line)
+            sys.stdout.write(line)
+        if proc.wait() != 0:
+            print("   📄 Full build output: %s" % log_path)
+            raise subprocess.CalledProcessError(proc.returncode, build)
+    return log_path, log_offset
+
+
+def read_ninja_log(path, all_sessions=False, offset=None):
+    """Parse .ninja_log into a list of edges: {'outputs', 'start', 'end'} (ms)
+
+    The log is appended to by every build. When `offset` (the size of the log
+    before the build) is known, only what was appended after it is read.
+
+    Otherwise the last build is guessed, best effort: entries are written in
+    completion order, so a drop in the end time is taken as the start of a new
+    build. A short build followed by one whose first edge ends later is not
+    detected and both get merged. all_sessions skips the guess and lets the
+    latest entry for each output win.
+    """
+
+    sessions = [[]]
+    last_end = -1
+
+    with open(path, 'rb') as f:
+        header = f.readline()
+        if not header.startswith(b'# ninja log v'):
+            raise ValueError("%s is not a ninja log" % path)
+
+        if offset is not None:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < offset:
+                # ninja recompacted the log at the start of the build
+                print("   ⚠️  .ninja_log was rewritten during the build, guessing the last build instead")
+                offset = None
+            else:
+                f.seek(max(offset, len(header)))
+
+        for line in f:
+            fields = line.decode('utf-8', 'replace').rstrip('\r\n').split('\t')
+            if len(fields) < 5:
+                continue
+            start, end = int(fields[0]), int(fields[1])
+            if end < last_end and offset is None:
+                sessions.append([])
+            last_end = end
+            sessions[-1].append((start, end, fields[3], fields[4]))
+
+    entries = sessions[-1] if not all_sessions else [e for s in sessions for e in s]
+
+    by_output = {}
+    for start, end, output, cmdhash in entries:
+        by_output[output] = (start, end, cmdhash)
+
+    # Edges with several outputs show up once per output; fold them back together.
+    edges = {}
+    for output, (start, end, cmdhash) in by_output.items():
+        key = (start, end, cmdhash)
+        if key not in edges:
+            edges[key] = {'outputs': [], 'start': start, 'end': end}
+        edges[key]['outputs'].append(output)
+
+    return sorted(edges.values(), key=lambda e: e['start'])
+
+
+def edge_object(edge):
+    """Return the object file produced by an edge, or None for non-compile steps"""
+    for output in edge['outputs']:
+        if output.endswith(OBJECT_EXTENSIONS):
+            return output
+    return None
+
+
+def tu_name(obj):
+    """Map 'src/CMakeFiles/zdoom.dir/common/engine/sc_man.cpp.o' to 'src/common/engine/sc_man.cpp'"""
+    obj = obj.replace('\\', '/')
+    match = re.match(r'^(.*?)CMakeFiles/[^/]+\.dir/(.*)$', obj)
+    if match:
+        obj = match.group(1) + match.group(2)
+    return os.path.splitext(obj)[0]
+
+
+def read_clang_trace(path):
+    """Load the complete ('X') events of a -ftime-trace file, times in ms"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    events = []
+    for event in data.get('traceEvents', []):
+        if event.get('ph') != 'X' or 'dur' not in event:
+            continue
+        events.append({
+            'name': event.get('name', ''),
+            'detail': event.get('args', {}).get('detail', ''),
+            'ts': event['ts'] / 1000.0,
+            'dur': event['dur'] / 1000.0,
+            'tid': event.get('tid', 0),
+        })
+    return events
+
+
+def clang_event_label(event):
+    """Short frame label for folded stacks"""
+    if event['detail']:
+        return '%s %s' % (event['name'], event['detail'].replace(';', ','))
+    return event['name']
+
+
+def analyze_clang_trace(tu, events, stats, folded):
+    """Attribute one TU's trace events to headers, templates and flame-graph frames"""
+
+    for event in events:
+        name = event['name']
+        if name == CLANG_HEADER_EVENT and event['detail']:
+            stats['headers'][os.path.normpath(event['detail'])] += event['dur']
+            stats['header_counts'][os.path.normpath(event['detail'])] += 1
+        elif name in CLANG_TEMPLATE_EVENTS and event['detail']:
+            stats['templates'][event['detail']] += event['dur']
+            stats['template_counts'][event['detail']] += 1
+        elif name in CLANG_PHASE_EVENTS:
+            stats['phases'][name] += event['dur']
+
+    # Rebuild the call tree from timestamps and emit self time per stack.
+    # Totals ('Total ...') and the process-wide 'ExecuteCompiler' span are skipped
+    # so that they do not swallow the frames underneath. Header spans include the
+    # headers they pull in, so those are also subtracted to get each header's own time.
+    spans = [e for e in events
+             if not e['name'].startswith('Total ') and e['name'] != 'ExecuteCompiler']
+    spans.sort(key=lambda e: (e['tid'], e['ts'], -e['dur']))
+
+    stack = []
+    for event in spans:
+        end = event['ts'] + event['dur']
+        while stack and (stack[-1]['tid'] != event['tid'] or event['ts'] >= stack[-1]['end']):
+            close_frame(stack, folded, stats)
+        header = None
+        if event['name'] == CLANG_HEADER_EVENT and event['detail']:
+            header = os.path.normpath(event['detail'])
+            for frame in reversed(stack):
+                if frame['header']:
+                    frame['nested'] += event['dur']
+                    break
+        if stack:
+            stack[-1]['child'] += event['dur']
+        stack.append({'tid': event['tid'], 'end': end, 'dur': event['dur'], 'child': 0.0,
+                      'header': header, 'nested': 0.0,
+                      'label': clang_event_label(event), 'path': None})
+        stack[-1]['path'] = ';'.join([tu] + [frame['label'] for frame in stack])
+    while stack:
+        close_frame(stack, folded, stats)
+
+
+def close_frame(stack, folded, stats):
+    """Pop a frame and record its self time"""
+    frame = stack.pop()
+    self_time = frame['dur'] - frame['child']
+    if self_time > 0:
+        folded[frame['path']] += self_time
+    if frame['header']:
+        stats['header_self'][frame['header']] += max(frame['dur'] - frame['nested'], 0.0)
+
+
+def read_gcc_log(path):
+    """Split a captured ninja+gcc log into per-TU phase timings (wall ms)"""
+
+    results = defaultdict(dict)
+    current = None
+
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            status = NINJA_STATUS_RE.match(line)
+            if status:
+                current = tu_name(status.group(1))
+                continue
+            if current is None:
+                continue
+            phase = GCC_PHASE_RE.match(line)
+            if not phase:
+                continue
+            times = [float(t) for t in GCC_TIME_RE.findall(phase.group(2))]
+            if not times:
+                # 'TOTAL' has no percentages on some versions
+                times = [float(t) for t in re.findall(r'[\d.]+', phase.group(2))]
+            if not times:
+                continue
+            # Columns are usr, sys, wall; older versions only have usr/sys.
+            wall = times[2] if len(times) >= 3 else sum(times[:2])
+            results[current][phase.group(1)] = wall * 1000.0
+
+    return results
+
+
+def trace_is_current(trace_path, obj_path):
+    """A trace older than its object file is left over from an earlier build"""
+    if not os.path.exists(obj_path):
+        return True
+    return os.path.getmtime(trace_path) + TRACE_MTIME_SLACK >= os.path.getmtime(obj_path)
+
+
+def collect(build_dir, all_sessions=False, gcc_log=None, log_offset=None, use_traces=True, find_gcc_log=True):
+    """Gather every available timing source for a build directory into one summary
+
+    Only TUs among the reported edges are kept. Traces older than their object
+    file are ignored, and so are all traces when use_traces is off ('run'
+    without --clang-trace). find_gcc_log picks up the log of an earlier
+    'run --gcc-report'; 'run' itself only passes the log it just wrote.
+    """
+
+    log_path = os.path.join(build_dir, '.ninja_log')
+    if not os.path.exists(log_path):
+        raise FileNotFoundError("No .ninja_log in %s - was the tree built with -G Ninja?" % build_dir)
+
+    edges = read_ninja_log(log_path, all_sessions, log_offset)
+
+    stats = {
+        'tus': {},
+        'other': {},
+        'headers': defaultdict(float),
+        'header_self': defaultdict(float),
+        'header_counts': defaultdict(int),
+        'templates': defaultdict(float),
+        'template_counts': defaultdict(int),
+        'phases': defaultdict(float),
+        'gcc_phases': {},
+    }
+    folded = defaultdict(float)
+    traced = 0
+
+    for edge in edges:
+        duration = float(edge['end'] - edge['start'])
+        obj = edge_object(edge)
+        if obj is None:
+            stats['other'][' '.join(edge['outputs'])] = duration
+            continue
+
+        tu = tu_name(obj)
+        stats['tus'][tu] = duration
+
+        trace_path = os.path.join(build_dir, os.path.splitext(obj)[0] + '.json')
+        if use_traces and os.path.exists(trace_path) and \
+                trace_is_current(trace_path, os.path.join(build_dir, obj)):
+            try:
+                events = read_clang_trace(trace_path)
+            except (ValueError, OSError):
+                events = None
+            if events:
+                analyze_clang_trace(tu, events, stats, folded)
+                traced += 1
+                continue
+
+        folded[tu] += duration
+
+    if gcc_log is None and find_gcc_log:
+        candidate = os.path.join(build_dir, GCC_LOG_NAME)
+        if os.path.exists(candidate):
+            gcc_log = candidate
+    if gcc_log:
+        stats['gcc_phases'] = dict((tu, phases) for tu, phases in read_gcc_log(gcc_log).items()
+                                   if tu in stats['tus'])
+        for tu, phases in stats['gcc_phases'].items():
+            for phase, ms in phases.items():
+                if phase != 'TOTAL':
+                    stats['phases'][phase] += ms
+
+    wall = 0
+    if edges:
+        wall = max(e['end'] for e in edges) - min(e['start'] for e in edges)
+
+    return {
+        'build_dir': os.path.abspath(build_dir),
+        'wall_ms': wall,
+        'traced_tus': traced,
+        'tus': stats['tus'],
+        'other': stats['other'],
+        'headers': {h: {'ms': ms, 'self_ms': stats['header_self'][h], 'count': stats['header_counts'][h]}
+                    for h, ms in stats['headers'].items()},
+        'templates': {t: {'ms': ms, 'count': stats['template_counts'][t]} for t, ms in stats['templates'].items()},
+        'phases': dict(stats['phases']),
+        'gcc_phases': stats['gcc_phases'],
+        'folded': dict(folded),
+    }
+
+
+def format_ms(ms):
+    if ms >= 60000:
+        return '%dm%04.1fs' % (ms // 60000, (ms % 60000) / 1000.0)
+    return '%.2fs' % (ms / 1000.0)
+
+
+def print_table(title, rows, top):
+    """rows: list of (label, ms, extra)"""
+    print("\n%s" % title)
+    print("=" * 60)
+    if not rows:
+        print("   (no data)")
+        return
+    for label, ms, extra in sorted(rows, key=lambda r: -r[1])[:top]:
+        print("  %10s  %s%s" % (format_ms(ms), label, extra))
+
+
+def print_report(summary, top):
+    tus = summary['tus']
+    cpu = sum(tus.values()) + sum(summary['other'].values())
+
+    print("🚀 Compile-time profile: %s" % summary['build_dir'])
+    print("=" * 60)
+    print("   Wall time:          %s" % format_ms(summary['wall_ms']))
+    print("   Summed edge time:   %s" % format_ms(cpu))
+    print("   Translation units:  %d (%d with -ftime-trace data)" % (len(tus), summary['traced_tus']))
+    if summary['gcc_phases']:
+        print("   GCC time reports:   %d" % len(summary['gcc_phases']))
+
+    print_table("⏱️  Slowest translation units", [(tu, ms, '') for tu, ms in tus.items()], top)
+
+    if summary['other']:
+        print_table("🔗 Slowest non-compile steps", [(o, ms, '') for o, ms in summary['other'].items()], top)
+
+    if summary['phases']:
+        print_table("📊 Compiler phases (summed over all TUs)",
+                    [(p, ms, '') for p, ms in summary['phases'].items()], top)
+
+    if summary['headers']:
+        print_table("📄 Most expensive headers (frontend parse time, summed)",
+                    [(h, v['ms'], '  (%d includes, %s avg, %s own)'
+                      % (v['count'], format_ms(v['ms'] / v['count']), format_ms(v['self_ms'])))
+                     for h, v in summary['headers'].items()], top)
+
+    if summary['templates']:
+        print_table("🧩 Most expensive template instantiations",
+                    [(t, v['ms'], '  (%dx)' % v['count']) for t, v in summary['templates'].items()], top)
+
+    if not summary['traced_tus'] and not summary['gcc_phases']:
+        print("\n💡 Tip: rebuild with 'run --clang-trace' (clang) or 'run --gcc-report' (gcc)")
+        print("   to get per-header and per-template attribution.")
+
+
+def write_folded(summary, path):
+    """Write Brendan Gregg style folded stacks, one sample per microsecond"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, ms in sorted(summary['folded'].items()):
+            samples = int(round(ms * 1000))
+            if samples > 0:
+                f.write('%s %d\n' % (stack, samples))
+    print("\n🔥 Folded stacks written to %s" % path)
+
+
+def compare_section(old, new, threshold, min_ms, key=None):
+    """Return rows (name, old_ms, new_ms) that regressed past the threshold"""
+    regressions = []
+    for name, new_value in new.items():
+        new_ms = new_value if key is None else new_value[key]
+        old_value = old.get(name)
+        old_ms = 0.0 if old_value is None else (old_value if key is None else old_value[key])
+        delta = new_ms - old_ms
+        if delta < min_ms:
+            continue
+        if old_ms and delta * 100.0 / old_ms < threshold:
+            continue
+        regressions.append((name, old_ms, new_ms))
+    return sorted(regressions, key=lambda r: r[1] - r[2])
+
+
+def compare(old_path, new_path, threshold, min_ms, top):
+    """Diff two saved summaries; returns the number of regressions found"""
+
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+
+    print("🔍 Comparing compile times")
+    print("=" * 60)
+    print("   Old: %s (wall %s)" % (old_path, format_ms(old['wall_ms'])))
+    print("   New: %s (wall %s)" % (new_path, format_ms(new['wall_ms'])))
+
+    old_total = sum(old['tus'].values())
+    new_total = sum(new['tus'].values())
+    change = (new_total - old_total) * 100.0 / old_total if old_total else 0.0
+    print("   Summed TU time: %s -> %s (%+.1f%%)" % (format_ms(old_total), format_ms(new_total), change))
+
+    sections = [
+        ("Translation units", old['tus'], new['tus'], None),
+        ("Headers", old['headers'], new['headers'], 'ms'),
+        ("Template instantiations", old['templates'], new['templates'], 'ms'),
+    ]
+
+    found = 0
+    for title, old_section, new_section, key in sections:
+        rows = compare_section(old_section, new_section, threshold, min_ms, key)
+        if not rows:
+            continue
+        found += len(rows)
+        print("\n⚠️  %s regressions" % title)
+        print("=" * 60)
+        for name, old_ms, new_ms in rows[:top]:
+            if old_ms:
+                print("  %10s -> %10s (%+.0f%%)  %s" % (format_ms(old_ms), format_ms(new_ms),
+                                                       (new_ms - old_ms) * 100.0 / old_ms, name))
+            else:
+                print("  %10s -> %10s (new)    %s" % ('-', format_ms(new_ms), name))
+
+    removed = sorted(set(old['tus']) - set(new['tus']))
+    if removed:
+        print("\nℹ️  %d translation units no longer built" % len(removed))
+
+    if found:
+        print("\n❌ %d regressions over %.0f%% / %dms" % (found, threshold, min_ms))
+    else:
+        print("\n✅ No compile-time regressions over %.0f%% / %dms" % (threshold, min_ms))
+    return found
+
+
+def add_report_options(parser):
+    parser.add_argument('--build-dir', default=BUILD_DIR,
+                        help="Ninja build directory (default: %(default)s)")
+    parser.add_argument('--top', type=int, default=30, help="rows per table")
+    parser.add_argument('--save', help="write the summary as JSON for 'compare'")
+    parser.add_argument('--folded', help="write folded stacks for flamegraph.pl / speedscope")
+
+
+def report(args, run=False):
+    if run:
+        summary = collect(args.build_dir, False, args.gcc_log, args.log_offset,
+                          use_traces=args.clang_trace, find_gcc_log=False)
+    else:
+        summary = collect(args.build_dir, args.all_sessions, args.gcc_log)
+    print_report(summary, args.top)
+    if args.folded:
+        write_folded(summary, args.folded)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=1, sort_keys=True)
+        print("💾 Summary written to %s" % args.save)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile-time profiler for the engine build")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_parser = commands.add_parser('run', help="configure with Ninja, build and report")
+    add_report_options(run_parser)
+    run_parser.add_argument('--source-dir', default=ROOT_DIR)
+    trace = run_parser.add_mutually_exclusive_group()
+    trace.add_argument('--clang-trace', action='store_true', help="compile with -ftime-trace")
+    trace.add_argument('--gcc-report', action='store_true', help="compile with -ftime-report")
+    run_parser.add_argument('-j', '--jobs', type=int)
+    run_parser.add_argument('cmake_args', nargs='*', help="extra arguments for the CMake configure step")
+
+    report_parser = commands.add_parser('report', help="report on an existing Ninja build")
+    add_report_options(report_parser)
+    report_parser.add_argument('--all-sessions', action='store_true',
+                               help="use every build recorded in .ninja_log, not just the last one")
+    report_parser.add_argument('--gcc-log', help="captured build output containing -ftime-report sections")
+
+    compare_parser = commands.add_parser('compare', help="diff two summaries saved with --save")
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=10.0,
+                                help="minimum relative increase in percent (default: %(default)s)")
+    compare_parser.add_argument('--min-ms', type=int, default=250,
+                                help="minimum absolute increase in ms (default: %(default)s)")
+    compare_parser.add_argument('--top', type=int, default=30, help="rows per table")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'compare':
+            sys.exit(1 if compare(args.old, args.new, args.threshold, args.min_ms, args.top) else 0)
+
+        if args.command == 'run':
+            # Only the build that just ran is of interest here.
+            args.gcc_log, args.log_offset = run_build(args.build_dir, args.source_dir, args.clang_trace,
+                                                      args.gcc_report, args.jobs, args.cmake_args)
+        report(args, args.command == 'run')
+    except subprocess.CalledProcessError as e:
+        print("\n❌ '%s' failed with exit code %d" % (' '.join(e.cmd), e.returncode))
+        sys.exit(1)
+    except (OSError, ValueError) as e:
+        print("\n❌ %s" % e)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,836 @@
+#!/usr/bin/env python3
+"""
+Data-driven precompiled header and unity build generator
+
+Scans every #include in src/, works out how often each header is pulled into
+the PCH translation units (transitively) and what it costs to parse, then writes
+
+  src/buildopt/g_pch_auto.h      g_pch.h plus the headers that pay off most
+  src/buildopt/unity_NNN.cpp     batches of TUs grouped by include similarity
+  src/buildopt/buildopt.cmake    the lists src/CMakeLists.txt needs to use them
+
+Turn them on with -DZDOOM_GENERATED_PCH=ON and/or -DZDOOM_UNITY_BUILD=ON.
+
+Parse cost is estimated from the number of code lines in each header, leaving
+out #ifdef blocks for macros nothing in the tree defines. Headers from outside
+the tree are run through the compiler's preprocessor (--compiler) and split
+into the files it reads, so shared library internals are only counted once;
+any that cannot be preprocessed fall back to a flat guess, and the report says
+so. A summary saved by tools/buildprofile/buildprofile.py (report --save) can
+be passed with --profile to use measured clang -ftime-trace times instead.
+
+Only PCH_SOURCES are batched since they all share the same compile settings.
+Left alone are TUs with their own source file properties in src/CMakeLists.txt,
+TUs that #define something before their last #include (to configure a header),
+and TUs that include generated or non-header files. TUs that define the same
+file-static names or macros, or that include the same header without an
+include guard, never end up in the same batch.
+
+Usage:
+  unitybuild.py [--batch-size 8] [--pch-share 0.25] [--compiler c++] [--profile summary.json] [--dry-run]
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPT_PATH = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.normpath(os.path.join(SCRIPT_PATH, os.pardir, os.pardir))
+SRC_DIR = os.path.join(ROOT_DIR, 'src')
+
+OUTPUT_NAME = 'buildopt'
+PCH_NAME = 'g_pch_auto.h'
+CMAKE_NAME = 'buildopt.cmake'
+BATCH_PREFIX = 'unity_'
+GENERATED_BANNER = '// Generated by tools/unitybuild/unitybuild.py - do not edit'
+
+SOURCE_EXTENSIONS = ('.cpp', '.c')
+HEADER_EXTENSIONS = ('.h', '.hpp', '.hh', '.hxx')
+
+# Same shape as the include regex in patch.py's add_include_to_file, with the
+# delimiters and the name captured.
+INCLUDE_RE = re.compile(r'^\s*#\s*include\s+([<"])(.*?)[>"]')
+DIRECTIVE_RE = re.compile(r'^\s*#\s*(\w+)\s*(\w*)')
+DEFINE_RE = re.compile(r'^#\s*define\s+(\w+)')
+IFDEF_RE = re.compile(r'^\s*#\s*(?:ifdef\s+(\w+)|if\s+defined\s*\(?\s*(\w+)\s*\)?)\s*$')
+IFNDEF_RE = re.compile(r'^\s*#\s*(?:ifndef\s+(\w+)|if\s+!\s*defined\s*\(?\s*(\w+)\s*\)?)\s*$')
+# File-scope internal linkage: 'static' at column 0, up to the declared name.
+STATIC_RE = re.compile(r'^static\s+(?:[\w:<>,*&\s]+?[\s*&])?(\w+)\s*(?:\(|=|;|\[)')
+FUNCTION_POINTER_RE = re.compile(r'^static\s+[\w:<>,*&\s]+?\(\s*\*\s*(?:const\s+)?(\w+)\s*(?:\[[^\]]*\]\s*)*\)')
+ANON_NAMESPACE_RE = re.compile(r'^namespace\s*\{')
+TOP_LEVEL_NAME_RE = re.compile(r'^(?:[\w:<>,*&]+\s+)+[*&]*(\w+)\s*(?:\(|=|;|\[)')
+# Matched left to right so that '//' inside a string or quotes inside a comment are not misread.
+COMMENT_OR_LITERAL_RE = re.compile(r'//[^\n]*|/\*.*?\*/'
+                                   r'|(?<!\w)(?:u8|u|U|L)?R"([^(\s"\\]*)\(.*?\)\1"'
+                                   r'|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL)
+LINE_MARKER_RE = re.compile(r'^#\s*\d+\s+"(.*)"')
+ELSE_BRANCH = '#else'  # stands in for a macro name on the conditions stack; cannot clash with one
+
+# Fallback cost of headers outside the tree that the preprocessor could not
+# size, in code lines. These are guesses, not measurements.
+EXTERNAL_CXX_COST = 3000
+EXTERNAL_C_COST = 300
+
+# Never put these in the PCH: they are platform specific or change meaning
+# depending on what has been defined before them.
+PCH_DENYLIST = {
+    'windows.h', 'direct.h', 'io.h', 'unistd.h', 'dirent.h', 'pthread.h',
+    'sys/mman.h', 'sys/time.h', 'sys/wait.h', 'fcntl.h', 'malloc.h',
+    'x86intrin.h', 'immintrin.h', 'emmintrin.h', 'xmmintrin.h', 'intrin.h',
+    'arm_neon.h', 'cpuid.h',
+}
+
+
+def read_text(path):
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return f.read()
+
+
+def strip_comments(text, literals=False):
+    """Remove /* */ and // comments, keeping line structure
+
+    With `literals`, string and character literals are emptied as well so that
+    braces and names inside them are not taken for code.
+    """
+    def replace(match):
+        token = match.group(0)
+        if token.startswith('/'):
+            return '\n' * token.count('\n')
+        if not literals:
+            return token
+        return token[-1] * 2 + '\n' * token.count('\n')
+    return COMMENT_OR_LITERAL_RE.sub(replace, text)
+
+
+def cmake_list(cmake_text, start):
+    """Return the entries of the first CMake call opening with the regex `start`"""
+    match = re.search(r'\b%s\s(.*?)\)' % start, cmake_text, re.DOTALL)
+    if not match:
+        return []
+    body = re.sub(r'#[^\n]*', '', match.group(1))
+    return body.split()
+
+
+def cmake_property_sources(cmake_text):
+    """Source files named literally in set_source_files_properties() or set_property(SOURCE) calls"""
+    sources = set()
+    calls = (r'\bset_source_files_properties\s*\((.*?)\bPROPERTIES\b',
+             r'\bset_property\s*\(\s*SOURCE\s(.*?)\b(?:PROPERTY|APPEND|APPEND_STRING|DIRECTORY|TARGET_DIRECTORY)\b')
+    for call in calls:
+        for match in re.finditer(call, cmake_text, re.DOTALL):
+            body = re.sub(r'#[^\n]*', '', match.group(1))
+            sources.update(entry for entry in body.split() if '$' not in entry)
+    return sources
+
+
+def matches_any(source, entries):
+    """Compare by trailing path too: entries in CMakeLists.txt are not always up to date"""
+    return any(source == entry or source.endswith('/' + entry) for entry in entries)
+
+
+class Header:
+    """A file that gets #included"""
+
+    def __init__(self, name, path):
+        self.name = name            # how it is spelled in the PCH
+        self.path = path            # absolute path, None if outside the tree
+        self.includes = []          # resolved Header objects, in order
+        self.includes_generated = False  # includes generated or non-header files
+        self.defines_first = False  # #defines something before its last #include
+        self.config_macros = set()  # ...and these are the macros it defines there
+        self.tested_macros = set()  # macros checked by its #if lines
+        self.used_conditionally = False
+        self.used_nested = False    # included inside braces, e.g. X-macro lists
+        self.used_toplevel = False  # included at file scope
+        self.guarded = False        # #pragma once or an include guard
+        self.macros = set()         # macros it #defines anywhere
+        self.code_lines = {}        # frozenset of #ifdef'd macros -> lines of code under them
+        self.identifiers = frozenset()
+        self.cost = 0.0             # its own code lines, in-tree files only
+        self.units = frozenset()    # files it stands for when sizing parse work, see IncludeGraph.lines
+        self.cost_guessed = False
+
+    @property
+    def external(self):
+        return self.path is None
+
+
+class IncludeGraph:
+    """Resolves and caches the include graph of the source tree"""
+
+    def __init__(self, src_dir, include_dirs):
+        self.src_dir = src_dir
+        self.include_dirs = [os.path.normpath(os.path.join(src_dir, d)) for d in include_dirs]
+        self.files = {}
+        self.unresolved = set()
+        self.defined_macros = set()
+        self.unit_lines = {}
+
+    def resolve(self, spelling, quoted, from_dir):
+        """Find the file an #include refers to; None if it lives outside the tree"""
+        search = ([from_dir] if quoted else []) + self.include_dirs
+        for directory in search:
+            candidate = os.path.normpath(os.path.join(directory, spelling))
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def get(self, path):
+        """Return the Header for a file in the tree, scanning it on first use"""
+        if path in self.files:
+            return self.files[path]
+
+        name = os.path.relpath(path, self.src_dir).replace(os.sep, '/')
+        header = Header(name, path)
+        self.files[path] = header
+
+        text = read_text(path)
+        lines = strip_comments(text).split('\n')
+        code = strip_comments(text, literals=True)
+        header.identifiers = frozenset(re.findall(r'\b[A-Za-z_]\w*', code))
+
+        # One entry per open conditional: the macro it needs defined to be
+        # compiled (#ifdef X, #if defined(X)), or None if it cannot be told.
+        conditions = []
+        braces = 0
+        guard = None
+        seen_directive = False
+        last_include = -1
+        defines = []
+        code_lines = defaultdict(int)
+
+        for number, (line, code_line) in enumerate(zip(lines, code.split('\n'))):
+            directive = DIRECTIVE_RE.match(line)
+            if not directive:
+                braces += code_line.count('{') - code_line.count('}')
+                if code_line.strip():
+                    code_lines[frozenset(c for c in conditions if c)] += 1
+                    seen_directive = True
+                continue
+            keyword, argument = directive.groups()
+            if keyword == 'pragma' and argument == 'once':
+                header.guarded = True
+
+            # An include guard wraps the whole file and does not make anything conditional.
+            # Only #includes may come before it; repeating those is harmless.
+            if not seen_directive and keyword == 'ifndef':
+                guard = argument
+                seen_directive = True
+                continue
+            if guard is not None:
+                if keyword != 'define' or argument != guard:
+                    conditions.append(None)
+                    header.tested_macros.add(guard)
+                else:
+                    header.guarded = True
+                guard = None
+                if keyword == 'define' and not conditions:
+                    continue
+            if keyword != 'include':
+                seen_directive = True
+
+            if keyword in ('if', 'ifdef', 'ifndef'):
+                required = IFDEF_RE.match(line)
+                conditions.append((required.group(1) or required.group(2)) if required else None)
+                header.tested_macros.update(re.findall(r'\w+', line[directive.end(1):]))
+            elif keyword in ('elif', 'else'):
+                if conditions:
+                    conditions[-1] = None
+                header.tested_macros.update(re.findall(r'\w+', line[directive.end(1):]))
+            elif keyword == 'endif':
+                if conditions:
+                    conditions.pop()
+            elif keyword == 'define':
+                # Conditional ones count too, e.g. WIN32_LEAN_AND_MEAN under #ifdef _WIN32.
+                defines.append((number, argument))
+                header.macros.add(argument)
+                self.defined_macros.add(argument)
+            elif keyword == 'include':
+                match = INCLUDE_RE.match(line)
+                if not match:
+                    continue
+                quoted = match.group(1) == '"'
+                spelling = match.group(2)
+                last_include = number
+                target = self.resolve(spelling, quoted, os.path.dirname(path))
+                if target is not None:
+                    child = self.get(target)
+                    if not target.endswith(HEADER_EXTENSIONS):
+                        header.includes_generated = True
+                elif quoted:
+                    # generated files in the build dir and the like
+                    self.unresolved.add(spelling)
+                    header.includes_generated = True
+                    continue
+                else:
+                    child = self.external(spelling)
+                header.includes.append(child)
+                if conditions:
+                    child.used_conditionally = True
+                if braces > 0:
+                    child.used_nested = True
+                else:
+                    child.used_toplevel = True
+
+        header.code_lines = dict(code_lines)
+        header.config_macros = set(name for number, name in defines if number < last_include)
+        header.defines_first = bool(header.config_macros)
+        return header
+
+    def external(self, spelling):
+        """Return the Header for a system/library header"""
+        key = '<%s>' % spelling
+        if key not in self.files:
+            self.files[key] = Header(spelling, None)
+        return self.files[key]
+
+    def compute_costs(self):
+        """Count the code lines of every in-tree file that can actually be compiled
+
+        Blocks under #ifdef X are only counted if X is #defined somewhere in the
+        tree; this drops things like STB_SPRINTF_IMPLEMENTATION sections.
+        """
+        for header in self.files.values():
+            if not header.external:
+                header.cost = float(sum(count for required, count in header.code_lines.items()
+                                        if required <= self.defined_macros))
+                header.units = frozenset([header.path])
+                self.unit_lines[header.path] = header.cost
+
+    def lines(self, units):
+        """Parse work of a set of files, each counted once
+
+        Every header stands for the files it adds to a TU: an in-tree header for
+        itself, a header from outside the tree for everything the preprocessor
+        reads for it. Library headers share most of their internals, so work is
+        always added up over distinct files, never per header.
+        """
+        return sum(self.unit_lines[unit] for unit in units)
+
+    def closure(self, header):
+        """All headers reachable from a file, in first-seen (include) order"""
+        order = []
+        seen = set()
+        stack = [iter(header.includes)]
+        while stack:
+            children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                continue
+            if child in seen:
+                continue
+            seen.add(child)
+            order.append(child)
+            stack.append(iter(child.includes))
+        return order
+
+
+def preprocessed_files(compiler, spelling):
+    """Code lines per file the compiler's preprocessor reads for '#include <spelling>', None on failure"""
+    try:
+        result = subprocess.run([compiler, '-E', '-x', 'c++', '-'], input='#include <%s>\n' % spelling,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                universal_newlines=True, errors='replace')
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+
+    files = defaultdict(int)
+    current = None
+    for line in result.stdout.split('\n'):
+        marker = LINE_MARKER_RE.match(line)
+        if marker:
+            current = None if marker.group(1).startswith('<') else os.path.normpath(marker.group(1))
+        elif current and line.strip():
+            files[current] += 1
+    return dict(files)
+
+
+def size_external(graph, compiler):
+    """Size headers from outside the tree with the real system include path
+
+    Each header is split into the files the preprocessor reads for it, so that
+    <iostream> and <string> share the cost of the library internals they both
+    pull in instead of each being charged for all of it. Headers the
+    preprocessor cannot find (other platforms, libraries not installed here) get
+    a flat guess. Returns the number of guessed headers.
+    """
+    externals = [h for h in graph.files.values() if h.external]
+    sizes = [None] * len(externals)
+    if compiler:
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as pool:
+            sizes = list(pool.map(lambda h: preprocessed_files(compiler, h.name), externals))
+
+    guessed = 0
+    for header, files in zip(externals, sizes):
+        if files is None:
+            key = '<%s>' % header.name
+            files = {key: EXTERNAL_C_COST if header.name.endswith('.h') else EXTERNAL_CXX_COST}
+            header.cost_guessed = True
+            guessed += 1
+        else:
+            header.cost_guessed = False
+        for path, count in files.items():
+            # Headers without include guards (stddef.h and friends) are read in
+            # pieces; keep the largest one.
+            graph.unit_lines[path] = max(graph.unit_lines.get(path, 0.0), float(count))
+        header.units = frozenset(files)
+    return guessed
+
+
+def apply_profile(graph, profile_path):
+    """Replace estimated file costs with measured -ftime-trace times
+
+    Uses each header's own time (without the headers it includes), averaged
+    per include, so that it can be added up like line counts. Measured times
+    are converted back to 'lines' using the overall ms/line ratio so that
+    measured and estimated files stay comparable.
+    """
+    with open(profile_path, 'r', encoding='utf-8') as f:
+        measured = json.load(f).get('headers', {})
+    if not measured:
+        print("   ⚠️  %s has no header timings (was it built with --clang-trace?)" % profile_path)
+        return 0
+    if any('self_ms' not in value for value in measured.values()):
+        print("   ⚠️  %s has no per-header own times, save it again with 'buildprofile.py report --save'"
+              % profile_path)
+        return 0
+
+    by_path = {}
+    for path, value in measured.items():
+        by_path[os.path.normpath(path).replace('\\', '/')] = value['self_ms'] / max(value['count'], 1)
+
+    matches = {}
+    for unit in graph.unit_lines:
+        if unit.startswith('<'):
+            continue
+        if unit.startswith(graph.src_dir + os.sep):
+            # in-tree files may have been measured in another checkout
+            suffix = '/' + os.path.relpath(unit, graph.src_dir).replace(os.sep, '/')
+            for path, ms in by_path.items():
+                if path.endswith(suffix):
+                    matches[unit] = ms
+                    break
+        elif unit.replace(os.sep, '/') in by_path:
+            matches[unit] = by_path[unit.replace(os.sep, '/')]
+
+    lines = sum(graph.unit_lines[unit] for unit in matches)
+    ms = sum(matches.values())
+    if not lines or not ms:
+        return 0
+    lines_per_ms = lines / ms
+    for unit, value in matches.items():
+        graph.unit_lines[unit] = value * lines_per_ms
+    return len(matches)
+
+
+def scan_internal_names(path):
+    """File-static functions/variables, anonymous namespace members and macros of a TU"""
+    names = set()
+    lines = strip_comments(read_text(path), literals=True).split('\n')
+    in_anon = False
+    brace_depth = 0
+
+    for line in lines:
+        define = DEFINE_RE.match(line.strip())
+        if define:
+            names.add(define.group(1))
+            continue
+        if brace_depth == 0:
+            if ANON_NAMESPACE_RE.match(line):
+                in_anon = True
+            match = FUNCTION_POINTER_RE.match(line) or STATIC_RE.match(line)
+            if match:
+                names.add(match.group(1))
+        elif in_anon and brace_depth == 1:
+            match = TOP_LEVEL_NAME_RE.match(line)
+            if match:
+                names.add(match.group(1))
+        brace_depth += line.count('{') - line.count('}')
+        if brace_depth <= 0:
+            brace_depth = 0
+            in_anon = False
+    return names
+
+
+def file_macros(path, keep):
+    """Macros a TU defines and does not #undef itself, to be #undef'd after it in a batch
+
+    Left out are
+      - macros only defined as a default under '#ifndef NAME': if NAME came from
+        the command line or the compiler, #undef would remove it for the rest
+        of the batch,
+      - macros defined in an #else or #elif branch, which is usually the
+        fallback that is not compiled,
+      - macros in `keep`, those that in-tree headers define: #undef would take
+        them away from the TUs after it, whose guarded headers are not read again,
+      - reserved names, which may be predefined.
+    """
+    defined = []
+    conditions = []
+    for line in strip_comments(read_text(path), literals=True).split('\n'):
+        line = line.strip()
+        directive = DIRECTIVE_RE.match(line)
+        if not directive:
+            continue
+        keyword = directive.group(1)
+        if keyword in ('if', 'ifdef', 'ifndef'):
+            unless = IFNDEF_RE.match(line)
+            conditions.append((unless.group(1) or unless.group(2)) if unless else None)
+        elif keyword in ('elif', 'else'):
+            if conditions:
+                conditions[-1] = ELSE_BRANCH
+        elif keyword == 'endif':
+            if conditions:
+                conditions.pop()
+        define = DEFINE_RE.match(line)
+        if define:
+            name = define.group(1)
+            if ELSE_BRANCH in conditions or name in conditions or name in keep or re.match(r'^_[_A-Z]', name):
+                continue
+            if name not in defined:
+                defined.append(name)
+        undef = re.match(r'^#\s*undef\s+(\w+)', line)
+        if undef and undef.group(1) in defined:
+            defined.remove(undef.group(1))
+    return defined
+
+
+def pch_eligible(header, config_macros):
+    """Can this header be force-included ahead of every PCH source?"""
+    if header.used_conditionally or header.used_nested or header.name in PCH_DENYLIST:
+        return False
+    if header.tested_macros & config_macros:
+        return False
+    if not header.external and (not header.guarded or not header.path.endswith(HEADER_EXTENSIONS)):
+        return False
+    return True
+
+
+def choose_pch(graph, tus, closures, existing, share, limit):
+    """Pick the headers worth precompiling, in an order that compiles
+
+    A header saves (uses - 1) times the lines of the files it adds that are not
+    precompiled yet. Headers are picked one at a time, best first, so that those
+    sharing library internals with one already picked are only credited for what
+    they add. Only headers reached by at least `share` of the TUs, guarded and never included under an #if or inside
+    braces, are considered. Headers that check a macro some TU defines before
+    including them are skipped too: the force-included PCH would come before
+    that #define.
+
+    Not every header is self-contained, so a chosen header also brings in the
+    headers that come before it in every TU using it, and is dropped if one of
+    those cannot go in the PCH. The result is ordered so that these always come
+    first.
+    """
+    config_macros = set()
+    for tu in tus.values():
+        config_macros |= tu.config_macros
+
+    uses = defaultdict(int)
+    position = defaultdict(float)
+    before = {}
+    for tu in tus:
+        order = closures[tu]
+        for index, header in enumerate(order):
+            uses[header] += 1
+            position[header] += float(index) / max(len(order), 1)
+            preceding = set(order[:index])
+            before[header] = preceding if header not in before else before[header] & preceding
+
+    def requirements(header):
+        return set(h for h in before[header] if h not in existing)
+
+    candidates = []
+    for header, count in uses.items():
+        if count < share * len(tus) or header in existing or not pch_eligible(header, config_macros):
+            continue
+        if not all(pch_eligible(h, config_macros) for h in requirements(header)):
+            continue
+        candidates.append(header)
+
+    covered = set().union(*(h.units for h in existing))
+    chosen = set()
+    savings = {}
+    while len(savings) < limit:
+        best = None
+        best_saving = 0.0
+        for header in candidates:
+            if header in chosen:
+                continue
+            saving = (uses[header] - 1) * graph.lines(header.units - covered)
+            if saving > best_saving:
+                best, best_saving = header, saving
+        if best is None:
+            break
+        added = requirements(best) | set([best])
+        chosen |= added
+        for header in added:
+            covered |= header.units
+        savings[best] = best_saving
+
+    # Emit every header after everything it needs; ties go by usual position.
+    result = []
+    emitted = set()
+    remaining = sorted(chosen, key=lambda h: position[h] / uses[h])
+    while remaining:
+        for header in remaining:
+            if requirements(header) <= emitted:
+                break
+        remaining.remove(header)
+        emitted.add(header)
+        result.append((header, savings.get(header, 0.0)))
+    return result
+
+
+def make_batches(tus, closures, names, own_cost, batch_size, max_lines, min_similarity):
+    """Greedily group TUs whose include sets overlap the most
+
+    Each batch starts from the first unassigned TU (sorted by path so neighbours
+    in the tree are tried first) and keeps adding the most similar TU that does
+    not clash with anything already in it. Two TUs clash if
+      - they share internal names,
+      - one has an internal name that a header of the other declares or uses,
+        and that its own headers do not,
+      - both include the same in-tree header without an include guard at file
+        scope: it would be compiled twice in the batch. Headers that are only
+        ever included inside braces (X-macro lists) are meant to be repeated.
+    """
+    sets = {tu: frozenset(closures[tu]) for tu in tus}
+    clashes = {}
+    identifiers = {}
+    private = {}
+    for tu in tus:
+        unguarded = set(h for h in closures[tu] if not h.external and not h.guarded and h.used_toplevel)
+        clashes[tu] = frozenset(names[tu]) | frozenset(unguarded)
+        identifiers[tu] = frozenset().union(*(h.identifiers for h in closures[tu] if not h.external))
+        private[tu] = frozenset(names[tu]) - identifiers[tu]
+    unassigned = sorted(tus)
+    batches = []
+
+    while unassigned:
+        seed = unassigned.pop(0)
+        batch = [seed]
+        union = set(sets[seed])
+        used_names = set(clashes[seed])
+        used_identifiers = set(identifiers[seed])
+        used_private = set(private[seed])
+        lines = own_cost[seed]
+
+        while len(batch) < batch_size and lines < max_lines:
+            best = None
+            best_score = min_similarity
+            for tu in unassigned:
+                if clashes[tu] & used_names or lines + own_cost[tu] > max_lines:
+                    continue
+                if private[tu] & used_identifiers or used_private & identifiers[tu]:
+                    continue
+                common = len(sets[tu] & union)
+                score = common / float(len(sets[tu] | union) or 1)
+                if score > best_score:
+                    best, best_score = tu, score
+            if best is None:
+                break
+            unassigned.remove(best)
+            batch.append(best)
+            union |= sets[best]
+            used_names |= clashes[best]
+            used_identifiers |= identifiers[best]
+            used_private |= private[best]
+            lines += own_cost[best]
+
+        batches.append(batch)
+
+    return batches
+
+
+def write_if_changed(path, content, dry_run):
+    """Only touch files whose content changed so that regenerating does not force a rebuild"""
+    if os.path.exists(path) and read_text(path) == content:
+        return False
+    if not dry_run:
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(content)
+    return True
+
+
+def pch_spelling(header, output_dir):
+    if header.external:
+        return '<%s>' % header.name
+    return '"%s"' % os.path.relpath(header.path, output_dir).replace(os.sep, '/')
+
+
+def generate(args):
+    src_dir = os.path.abspath(args.src_dir)
+    output_dir = os.path.join(src_dir, OUTPUT_NAME)
+    cmake_text = read_text(os.path.join(src_dir, 'CMakeLists.txt'))
+
+    print("🚀 PCH / unity build generator")
+    print("=" * 60)
+    print("📁 Source directory: %s" % src_dir)
+
+    include_dirs = [d for d in cmake_list(cmake_text, r'include_directories\s*\(\s*BEFORE')
+                    if '$' not in d]
+    pch_sources = [s for s in cmake_list(cmake_text, r'set\s*\(\s*PCH_SOURCES')
+                   if s.endswith(SOURCE_EXTENSIONS) and os.path.isfile(os.path.join(src_dir, s))]
+    if not pch_sources:
+        print("   ❌ Could not find PCH_SOURCES in src/CMakeLists.txt")
+        return 1
+
+    graph = IncludeGraph(src_dir, include_dirs)
+    tus = {}
+    for source in pch_sources:
+        tus[source] = graph.get(os.path.normpath(os.path.join(src_dir, source)))
+
+    # Everything g_pch.h pulls in is already precompiled.
+    existing_pch = graph.get(os.path.join(src_dir, 'g_pch.h'))
+    existing = set(graph.closure(existing_pch))
+
+    closures = {source: graph.closure(tu) for source, tu in tus.items()}
+    headers = [h for h in graph.files.values() if h not in tus.values()]
+    print("   %d PCH translation units, %d headers, %d unresolved (generated) includes"
+          % (len(tus), len(headers), len(graph.unresolved)))
+
+    graph.compute_costs()
+    guessed = size_external(graph, args.compiler)
+    externals = sum(1 for h in headers if h.external)
+    print("   %d of %d external headers sized with %s" % (externals - guessed, externals, args.compiler or 'no compiler'))
+    if args.profile:
+        print("   ⏱️  %d file costs taken from %s" % (apply_profile(graph, args.profile), args.profile))
+    guessed = set(h for h in headers if h.cost_guessed)
+    if guessed:
+        print("   ⚠️  %d header costs are guesses (marked *), pass --profile for measured ones" % len(guessed))
+
+    units = {tu: frozenset().union(*(h.units for h in closures[tu])) for tu in tus}
+    existing_units = frozenset().union(*(h.units for h in existing))
+    before = sum(graph.lines(units[tu] - existing_units) for tu in tus)
+
+    # --- PCH ---
+    chosen = choose_pch(graph, tus, closures, existing, args.pch_share, args.pch_max)
+    pch_units = existing_units.union(*(header.units for header, _ in chosen))
+
+    print("\n📄 Precompiled header: %d headers added to g_pch.h" % len(chosen))
+    for header, saving in sorted((c for c in chosen if c[1]), key=lambda c: -c[1])[:args.top]:
+        print("   %12.0f%s %s" % (saving, '*' if header.cost_guessed else ' ', header.name))
+
+    pch_lines = [GENERATED_BANNER, '#pragma once', '',
+                 '// The hand-picked set stays first: sources have come to rely on it.',
+                 '#include "%s"' % os.path.relpath(existing_pch.path, output_dir).replace(os.sep, '/'),
+                 '']
+    pch_lines += ['#include %s' % pch_spelling(header, output_dir) for header, _ in chosen]
+
+    # --- unity batches ---
+    property_sources = cmake_property_sources(cmake_text)
+    candidates = []
+    skipped = []
+    for source, tu in tus.items():
+        if matches_any(source, property_sources) or source.endswith('.c'):
+            skipped.append(source)
+        elif tu.defines_first or tu.includes_generated:
+            skipped.append(source)
+        elif any(h.includes_generated or (not h.external and not h.path.endswith(HEADER_EXTENSIONS))
+                 for h in closures[source]):
+            skipped.append(source)
+        elif args.exclude and re.search(args.exclude, source):
+            skipped.append(source)
+        else:
+            candidates.append(source)
+
+    names = {tu: frozenset(scan_internal_names(tus[tu].path)) for tu in candidates}
+    header_macros = set().union(*(h.macros for h in headers if not h.external))
+    own_cost = {tu: tus[tu].cost for tu in candidates}
+    batches = make_batches(candidates, closures, names, own_cost,
+                           args.batch_size, args.max_batch_lines, args.min_similarity)
+    multi = [b for b in batches if len(b) > 1]
+
+    after = 0.0
+    for tu in skipped:
+        after += graph.lines(units[tu] - pch_units)
+    for batch in batches:
+        after += graph.lines(frozenset().union(*(units[tu] for tu in batch)) - pch_units)
+
+    print("\n🧱 Unity build: %d TUs in %d batches, %d excluded, %d left alone"
+          % (sum(len(b) for b in multi), len(multi), len(skipped), len(batches) - len(multi)))
+    print("   Estimated header parse work outside g_pch.h: %s -> %s lines (%+.0f%%)"
+          % (format(before, ',.0f'), format(after, ',.0f'), (after - before) * 100.0 / (before or 1)))
+    if guessed:
+        print("   ⚠️  This estimate includes guessed costs for %d headers" % len(guessed))
+
+    # --- output ---
+    if not args.dry_run:
+        os.makedirs(output_dir, exist_ok=True)
+
+    changed = 0
+    changed += write_if_changed(os.path.join(output_dir, PCH_NAME), '\n'.join(pch_lines) + '\n', args.dry_run)
+
+    batch_files = []
+    for index, batch in enumerate(multi):
+        name = '%s%03d.cpp' % (BATCH_PREFIX, index)
+        batch_files.append(name)
+        lines = [GENERATED_BANNER, '']
+        for tu in batch:
+            lines.append('#include "%s"' % os.path.relpath(tus[tu].path, output_dir).replace(os.sep, '/'))
+            for macro in file_macros(tus[tu].path, header_macros):
+                lines.append('#undef %s' % macro)
+        changed += write_if_changed(os.path.join(output_dir, name), '\n'.join(lines) + '\n', args.dry_run)
+
+    stale = []
+    if os.path.isdir(output_dir):
+        stale = [f for f in os.listdir(output_dir)
+                 if f.startswith(BATCH_PREFIX) and f.endswith('.cpp') and f not in batch_files]
+    if not args.dry_run:
+        for name in stale:
+            os.remove(os.path.join(output_dir, name))
+
+    batched = sorted(tu for batch in multi for tu in batch)
+    cmake = ['# Generated by tools/unitybuild/unitybuild.py - do not edit',
+             '# Included from src/CMakeLists.txt when ZDOOM_GENERATED_PCH or ZDOOM_UNITY_BUILD is on.',
+             '',
+             'set( GENERATED_PCH %s/%s )' % (OUTPUT_NAME, PCH_NAME),
+             '',
+             'set( UNITY_BATCH_SOURCES']
+    cmake += ['\t%s/%s' % (OUTPUT_NAME, name) for name in batch_files]
+    cmake += [')', '', 'set( UNITY_BATCHED_SOURCES']
+    cmake += ['\t%s' % tu for tu in batched]
+    cmake += [')']
+    changed += write_if_changed(os.path.join(output_dir, CMAKE_NAME), '\n'.join(cmake) + '\n', args.dry_run)
+
+    if args.dry_run:
+        print("\n💡 Dry run: %d files would change, %d stale batches would be removed" % (changed, len(stale)))
+    else:
+        print("\n✅ %d files updated in %s, %d stale batches removed" % (changed, output_dir, len(stale)))
+        print("\n📋 Next Steps:")
+        print("=" * 60)
+        print("   cmake -DZDOOM_GENERATED_PCH=ON -DZDOOM_UNITY_BUILD=ON ..")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate an optimized PCH and unity build batches for src/")
+    parser.add_argument('--src-dir', default=SRC_DIR, help="engine source directory (default: %(default)s)")
+    parser.add_argument('--profile', help="summary JSON from 'buildprofile.py report --save'")
+    parser.add_argument('--compiler', default=os.environ.get('CXX', 'c++'),
+                        help="compiler used to size system headers, '' to skip (default: %(default)s)")
+    parser.add_argument('--pch-share', type=float, default=0.25,
+                        help="minimum share of TUs that must include a header to precompile it (default: %(default)s)")
+    parser.add_argument('--pch-max', type=int, default=40, help="maximum headers to add to the PCH (default: %(default)s)")
+    parser.add_argument('--batch-size', type=int, default=8, help="maximum TUs per unity batch (default: %(default)s)")
+    parser.add_argument('--max-batch-lines', type=int, default=15000,
+                        help="maximum code lines of the TUs in one batch (default: %(default)s)")
+    parser.add_argument('--min-similarity', type=float, default=0.3,
+                        help="minimum include-set similarity to join a batch, 0..1 (default: %(default)s)")
+    parser.add_argument('--exclude', help="regex of PCH_SOURCES never to batch")
+    parser.add_argument('--top', type=int, default=20, help="PCH headers to list")
+    parser.add_argument('--dry-run', action='store_true', help="report only, do not write anything")
+    sys.exit(generate(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()